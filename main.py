@@ -1,16 +1,31 @@
 import os
 import re
 import time
-import base64
-import urllib.request
+import heapq
+import random
+import hashlib
+import asyncio
+import functools
+import secrets
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from itertools import islice
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 
-from fastapi import FastAPI, HTTPException, Response
+import httpx
+from fastapi import BackgroundTasks, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, ORJSONResponse
 from pydantic import BaseModel
 from yt_dlp import YoutubeDL
-from urllib.error import HTTPError
+
+from transcript_text import render_pdf, vtt_to_srt_bytes, write_atomic, write_transcript
 
 # -----------------------------
 # Config
@@ -18,11 +33,132 @@ from urllib.error import HTTPError
 PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")
 EXPIRES_IN_SECONDS = int(os.getenv("FILE_EXPIRES_SECONDS", "86400"))  # default 24h
 PORT = int(os.getenv("PORT", "8000"))
+CACHE_DIR = Path(os.getenv("CACHE_DIR", "/tmp/transcripts"))  # per-video workdirs, reused across requests
+META_TTL_SECONDS = int(os.getenv("META_TTL_SECONDS", "3600"))
+META_TTL_EMPTY_SECONDS = int(os.getenv("META_TTL_EMPTY_SECONDS", "300"))  # videos without captions
+META_CACHE_MAX = int(os.getenv("META_CACHE_MAX", "1024"))  # videos kept in the metadata cache
+PDF_WAIT_SECONDS = float(os.getenv("PDF_WAIT_SECONDS", "30"))  # /file waits this long for a pending PDF
+# Cores this process may actually use; os.cpu_count() reports the host's inside containers
+_CPUS = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+# Leave a core for the event loop; 0 = run CPU stages in threads
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(min(4, _CPUS - 1))))
+YT_CONCURRENCY = int(os.getenv("YT_CONCURRENCY", "4"))  # yt-dlp extractions in flight
+YDL_MAX_USES = int(os.getenv("YDL_MAX_USES", "200"))  # extractions before a thread's YoutubeDL is rebuilt
+# Threads for yt-dlp and file I/O; extractions mostly wait on the network, so leave room beyond them
+TRANSCRIPT_WORKERS = int(os.getenv("TRANSCRIPT_WORKERS", str(min(32, YT_CONCURRENCY + 4 * _CPUS))))
+YT_QUEUE_SECONDS = float(os.getenv("YT_QUEUE_SECONDS", "10"))  # wait for a slot before answering 503
+CAPTION_CANDIDATES = int(os.getenv("CAPTION_CANDIDATES", "3"))  # tracks fetched in parallel
+MAX_FILES = int(os.getenv("MAX_FILES", "10000"))  # download tokens kept; oldest are evicted first
+JANITOR_SECONDS = float(os.getenv("JANITOR_SECONDS", "60"))  # how often expired files are purged
+CACHE_SWEEP_SECONDS = float(os.getenv("CACHE_SWEEP_SECONDS", "3600"))  # how often CACHE_DIR is swept for orphans
 
 # -----------------------------
 # App
 # -----------------------------
-app = FastAPI(title="Creator Transcript Fetcher", version="3.1.0")
+# Shared async HTTP client: keep-alive HTTP/2 pool so caption downloads reuse
+# connections to YouTube instead of paying a TLS handshake each time
+HTTP = httpx.AsyncClient(
+    timeout=30,
+    follow_redirects=True,
+    # Pool settings live on the transport; retries cover dropped connections, 429s are handled in http_fetch
+    transport=httpx.AsyncHTTPTransport(
+        http2=True,
+        retries=2,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    ),
+    headers={
+        "User-Agent": (
+            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+            "AppleWebKit/537.36 (KHTML, like Gecko) "
+            "Chrome/124.0 Safari/537.36"
+        )
+    },
+)
+
+
+# Blocking transcript work (yt-dlp extraction, cache reads/writes) gets its own
+# threads so slow extractions cannot starve the default executor
+_IO_POOL = ThreadPoolExecutor(TRANSCRIPT_WORKERS, thread_name_prefix="transcript")
+
+
+async def run_io(fn, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(_IO_POOL, functools.partial(fn, *args, **kwargs))
+
+
+# Extractions beyond this just compete for bandwidth and YouTube's rate limit
+_YT_SEM = asyncio.Semaphore(YT_CONCURRENCY)
+
+
+# Text cleaning and PDF rendering are pure-Python CPU work; a process pool lets
+# them run in parallel instead of serialising on this process's GIL
+_CPU_POOL: Optional[ProcessPoolExecutor] = None
+
+
+async def run_cpu(fn, *args):
+    global _CPU_POOL
+    if CPU_WORKERS <= 0:
+        return await run_io(fn, *args)
+    for attempt in (1, 2):
+        if _CPU_POOL is None:
+            _CPU_POOL = ProcessPoolExecutor(CPU_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        pool = _CPU_POOL
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+        except BrokenProcessPool:
+            # A dead worker (OOM kill, crash) breaks the pool for good; replace it and retry once
+            if _CPU_POOL is pool:
+                _CPU_POOL = None
+                pool.shutdown(wait=False, cancel_futures=True)
+            if attempt == 2:
+                raise
+
+
+async def _janitor() -> None:
+    next_sweep = 0.0
+    while True:
+        # Also runs at startup, for files left behind by a previous process
+        if time.monotonic() >= next_sweep:
+            next_sweep = time.monotonic() + CACHE_SWEEP_SECONDS
+            await run_io(_sweep_cache)
+        # Wake for the next expiry if it is due before the regular interval
+        wait = JANITOR_SECONDS
+        if _EXPIRY_HEAP:
+            wait = min(wait, max(_EXPIRY_HEAP[0][0] - _now(), 0) + 1)
+        await asyncio.sleep(wait)
+        _purge_expired()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    janitor = asyncio.create_task(_janitor())
+    yield
+    janitor.cancel()
+    await HTTP.aclose()
+    _IO_POOL.shutdown(cancel_futures=True)
+    if _CPU_POOL is not None:
+        _CPU_POOL.shutdown(cancel_futures=True)
+
+
+class _GZipExceptPdf(GZipMiddleware):
+    """Gzip responses, except PDF downloads: those are already compressed."""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith("/file/"):
+            meta = FILES.get(scope["path"][len("/file/"):])
+            if meta and meta["mime"] == "application/pdf":
+                await self.app(scope, receive, send)
+                return
+        await super().__call__(scope, receive, send)
+
+
+app = FastAPI(
+    title="Creator Transcript Fetcher",
+    version="3.1.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
+# SRT/TXT downloads and previews are repetitive text; level 5 keeps most of the gain for far less CPU than 9
+app.add_middleware(_GZipExceptPdf, minimum_size=1024, compresslevel=5)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -34,10 +170,14 @@ app.add_middleware(
 # Ephemeral file storage
 # -----------------------------
 FILES: Dict[str, Dict] = {}
+_EXPIRY_HEAP: List[Tuple[int, str]] = []  # (expires_at, token)
+_PATH_REFS: Dict[str, int] = {}  # live tokens per file; cached SRTs are shared between tokens
+_DIR_REFS: Dict[str, int] = {}  # live tokens plus in-flight requests per video dir
+_PREVIEWS: Dict[str, Tuple[str, bool]] = {}  # shared .txt path -> (preview, truncated)
 
 
 def _tok() -> str:
-    return base64.urlsafe_b64encode(os.urandom(16)).decode("ascii").rstrip("=")
+    return secrets.token_urlsafe(16)
 
 
 def _now() -> int:
@@ -45,30 +185,135 @@ def _now() -> int:
 
 
 def _purge_expired() -> None:
-    dead = []
-    for t, meta in FILES.items():
-        if meta["expires_at"] <= _now() or not Path(meta["path"]).exists():
-            dead.append(t)
-    for t in dead:
+    # Pop only the tokens at the head of the expiry heap instead of scanning FILES
+    now = _now()
+    while _EXPIRY_HEAP and _EXPIRY_HEAP[0][0] <= now:
+        _evict_oldest()
+
+
+def _evict_oldest() -> None:
+    _, t = heapq.heappop(_EXPIRY_HEAP)
+    _drop_file(t)
+
+
+def _drop_file(token: str) -> None:
+    meta = FILES.pop(token, None)
+    if not meta:
+        return
+    _unref_file(meta["path"])
+    if "source" in meta:
+        _unref_file(meta.pop("source"))
+    _release_dir(Path(meta["path"]).parent)
+
+
+def _unref_file(path: str) -> None:
+    if _release_path(path):
+        _PREVIEWS.pop(path, None)
         try:
-            Path(FILES[t]["path"]).unlink(missing_ok=True)
+            Path(path).unlink(missing_ok=True)
         except Exception:
             pass
-        FILES.pop(t, None)
 
 
-def _store_file(path: Path, mime: str, filename: str) -> str:
-    _purge_expired()
+def _release_path(path: str) -> bool:
+    """Drop one reference to `path`; True when no live token uses it anymore."""
+    n = _PATH_REFS.get(path, 1) - 1
+    if n > 0:
+        _PATH_REFS[path] = n
+        return False
+    _PATH_REFS.pop(path, None)
+    return True
+
+
+def _hold_dir(d: Path) -> None:
+    _DIR_REFS[str(d)] = _DIR_REFS.get(str(d), 0) + 1
+
+
+def _release_dir(d: Path) -> None:
+    """Drop one reference to a video dir and remove it once nothing uses it."""
+    n = _DIR_REFS.get(str(d), 1) - 1
+    if n > 0:
+        _DIR_REFS[str(d)] = n
+        return
+    _DIR_REFS.pop(str(d), None)
+    try:
+        d.rmdir()  # fails, and is left alone, while an untracked cached SRT is still there
+    except OSError:
+        pass
+
+
+def _store_file(
+    path: Path,
+    mime: str,
+    filename: str,
+    ready: Optional[asyncio.Event] = None,
+    source: Optional[Path] = None,
+) -> str:
+    """Register a file for download.
+
+    Pass `source` (a transcript .txt) for a PDF rendered from it: with `ready` the
+    render is already under way, without it /file renders on first download. The
+    token holds a reference on `source` until the render is done.
+    """
     token = _tok()
+    expires_at = _now() + EXPIRES_IN_SECONDS
     FILES[token] = {
         "path": str(path),
         "mime": mime,
         "filename": filename,
-        "expires_at": _now() + EXPIRES_IN_SECONDS,
+        "expires_at": expires_at,
     }
+    if ready is not None:
+        FILES[token]["ready"] = ready
+    if source is not None:
+        FILES[token]["source"] = str(source)
+        _PATH_REFS[str(source)] = _PATH_REFS.get(str(source), 0) + 1
+    heapq.heappush(_EXPIRY_HEAP, (expires_at, token))
+    _PATH_REFS[str(path)] = _PATH_REFS.get(str(path), 0) + 1
+    _hold_dir(path.parent)
+    while len(FILES) > MAX_FILES:
+        _evict_oldest()
     return token
 
 
+def _video_dir(video_id: str) -> Path:
+    # Non-YouTube inputs come back from extract_video_id unchanged; never use them as a path
+    name = video_id if _RE_VID_RAW.fullmatch(video_id) else hashlib.sha1(video_id.encode()).hexdigest()
+    return CACHE_DIR / name
+
+
+def _read_cached(path: Path) -> Optional[bytes]:
+    try:
+        if time.time() - path.stat().st_mtime < EXPIRES_IN_SECONDS:
+            return path.read_bytes()
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def _sweep_cache() -> None:
+    """Remove files under CACHE_DIR that no token references once they are older than EXPIRES_IN_SECONDS.
+
+    Refcounts only cover files this process handed out; this catches the rest, e.g.
+    leftovers of failed requests or of a previous process. Dirs in use are skipped.
+    """
+    cutoff = time.time() - EXPIRES_IN_SECONDS
+    try:
+        dirs = [d for d in CACHE_DIR.iterdir() if d.is_dir()]
+    except FileNotFoundError:
+        return
+    for d in dirs:
+        if str(d) in _DIR_REFS:
+            continue
+        try:
+            for f in d.iterdir():
+                if str(f) not in _PATH_REFS and f.stat().st_mtime < cutoff:
+                    f.unlink(missing_ok=True)
+            d.rmdir()  # fails, and is left alone, while newer files remain
+        except OSError:
+            pass
+
+
 def _file_url(token: str) -> str:
     base = PUBLIC_BASE_URL or "https://vidalchemy-transcript-api-production.up.railway.app"
     return f"{base}/file/{token}"
@@ -76,6 +321,9 @@ def _file_url(token: str) -> str:
 # -----------------------------
 # Utility
 # -----------------------------
+_RE_VID = re.compile(r"(?:v=|youtu\.be/|shorts/)([A-Za-z0-9_-]{11})")
+_RE_VID_RAW = re.compile(r"[A-Za-z0-9_-]{11}")
+
 def pretty_duration(seconds: int) -> str:
     if not seconds:
         return "0s"
@@ -102,190 +350,230 @@ def ordered_langs(user_langs: str) -> List[str]:
     if not user_langs:
         return pref + ["all"]
 
-    parts = [normalize_lang(p) for p in user_langs.split(",") if p.strip()]
-    seen, out = set(), []
-    for p in parts:
-        if p not in seen:
-            out.append(p)
-            seen.add(p)
+    out = list(dict.fromkeys(normalize_lang(p) for p in user_langs.split(",") if p.strip()))
     if "all" not in out:
         out.append("all")
     return out
 
 
+@functools.lru_cache(maxsize=4096)
 def extract_video_id(url_or_id: str) -> str:
     u = url_or_id.strip()
-    m = re.search(r"(?:v=|youtu\.be/|shorts/)([A-Za-z0-9_-]{11})", u)
+    m = _RE_VID.search(u)
     if m:
         return m.group(1)
-    if re.fullmatch(r"[A-Za-z0-9_-]{11}", u):
+    if _RE_VID_RAW.fullmatch(u):
         return u
     return u
 
 
-def yt_info(url: str) -> dict:
-    ydl_opts = {
-        "quiet": True,
-        "skip_download": True,
-        "no_warnings": True,
-        "nocheckcertificate": True,
-        "geo_bypass": True,
-        "cachedir": False,
-        "ignoreerrors": True,
-        "noprogress": True,
-        "simulate": True,
-    }
-    with YoutubeDL(ydl_opts) as ydl:
+_YDL_OPTS = {
+    "quiet": True,
+    "skip_download": True,
+    "no_warnings": True,
+    "nocheckcertificate": True,
+    "geo_bypass": True,
+    "cachedir": False,
+    "ignoreerrors": True,
+    "noprogress": True,
+    "simulate": True,
+    # Only metadata and caption tracks are used; skip fetching the DASH/HLS format manifests
+    "extractor_args": {"youtube": {"skip": ["dash", "hls"]}},
+}
+# Building a YoutubeDL costs tens of ms; reuse one per worker thread (instances are not thread-safe)
+_YDL_LOCAL = threading.local()
+
+
+def _ydl() -> YoutubeDL:
+    ydl = getattr(_YDL_LOCAL, "ydl", None)
+    # Rebuild now and then so connection and extractor state don't live for the process lifetime
+    if ydl is None or _YDL_LOCAL.uses >= YDL_MAX_USES:
+        _reset_ydl()
+        ydl = _YDL_LOCAL.ydl = YoutubeDL(dict(_YDL_OPTS))
+        _YDL_LOCAL.uses = 0
+    _YDL_LOCAL.uses += 1
+    return ydl
+
+
+def _reset_ydl() -> None:
+    """Close this thread's YoutubeDL; the next extraction builds a fresh one."""
+    ydl = getattr(_YDL_LOCAL, "ydl", None)
+    _YDL_LOCAL.ydl = None
+    if ydl is not None:
+        try:
+            ydl.close()
+        except Exception:
+            pass
+
+
+_META_KEYS = ("title", "uploader", "upload_date", "duration", "subtitles", "automatic_captions")
+
+
+def _yt_info_uncached(url: str) -> dict:
+    ydl = _ydl()
+    try:
         info = ydl.extract_info(url, download=False)
+    except Exception:
+        _reset_ydl()
+        raise
+    finally:
+        # Cookies YouTube sets during one extraction must not follow the next request
+        ydl.cookiejar.clear()
+    if not info:
+        _reset_ydl()  # ignoreerrors turns failures into None; don't reuse a possibly broken instance
     if info and info.get("entries"):
         info = info["entries"][0]
     if not isinstance(info, dict):
         raise Exception("Failed to fetch video metadata.")
-    return info
+    # Cache only what the endpoints read; the full info dict (formats, thumbnails, ...) runs to MBs
+    return {k: info[k] for k in _META_KEYS if k in info}
 
 
-def best_caption_url(tracks: List[dict]) -> Optional[str]:
-    if not tracks:
-        return None
-    for t in tracks:
-        if (t.get("ext") or "").lower() == "vtt" and t.get("url"):
-            return t["url"]
-    for t in tracks:
-        if t.get("url"):
-            return t["url"]
+# video_id -> (expires_at, info), least recently used first; yt_info runs in worker threads, hence the lock
+_META_CACHE: "OrderedDict[str, Tuple[int, dict]]" = OrderedDict()
+_META_LOCK = threading.Lock()
+
+
+def cached_info(url: str) -> Optional[dict]:
+    key = extract_video_id(url)
+    with _META_LOCK:
+        hit = _META_CACHE.get(key)
+        if hit and hit[0] > _now():
+            _META_CACHE.move_to_end(key)
+            return hit[1]
+        _META_CACHE.pop(key, None)
     return None
 
 
-def http_fetch(url: str) -> bytes:
-    """Fetch URL with retry/backoff on 429 errors."""
-    delays = [2, 5, 10]
-    last_err = None
-    for attempt, delay in enumerate(delays, start=1):
-        try:
-            req = urllib.request.Request(
-                url,
-                headers={
-                    "User-Agent": (
-                        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                        "AppleWebKit/537.36 (KHTML, like Gecko) "
-                        "Chrome/124.0 Safari/537.36"
-                    )
-                },
-            )
-            with urllib.request.urlopen(req, timeout=30) as r:
-                return r.read()
-        except HTTPError as e:
-            if e.code == 429:
-                last_err = e
-                if attempt < len(delays):
-                    time.sleep(delay)
-                    continue
-            raise
-        except Exception as e:
-            last_err = e
-            break
-    if last_err:
-        raise last_err
-
-
-def vtt_to_srt_bytes(vtt: bytes) -> bytes:
-    text = vtt.decode("utf-8", errors="ignore")
-    lines = [ln for ln in text.splitlines() if not ln.strip().startswith("WEBVTT")]
-    out_lines, buf, idx = [], [], 1
-
-    def flush():
-        nonlocal idx, buf
-        if not buf:
-            return
-        head = buf[0].replace(".", ",")
-        out_lines.append(str(idx))
-        out_lines.append(head)
-        for tline in buf[1:]:
-            if "-->" not in tline:
-                out_lines.append(re.sub(r"<[^>]+>", "", tline))
-        out_lines.append("")
-        idx += 1
-        buf.clear()
-
-    for ln in lines:
-        if re.match(r"^\s*$", ln):
-            flush()
-            continue
-        if "-->" in ln:
-            if buf:
-                flush()
-            buf = [ln.strip()]
-        else:
-            if buf:
-                buf.append(ln)
-    flush()
-    return ("\n".join(out_lines)).encode("utf-8")
-
-
-def clean_srt_text(srt_bytes: bytes, keep_ts: bool) -> str:
-    raw = srt_bytes.decode("utf-8", errors="ignore").strip()
-    if not raw:
-        return ""
-    blocks = re.split(r"\n\s*\n", raw)
-    lines = []
-    for blk in blocks:
-        blk = re.sub(r"^\s*\d+\s*\n", "", blk)
-        m = re.search(r"(\d{2}:\d{2}:\d{2}),\d{3}\s*-->", blk)
-        text = re.sub(
-            r"(?m)^\d{2}:\d{2}:\d{2},\d{3}\s*-->\s*\d{2}:\d{2}:\d{2},\d{3}.*$",
-            "",
-            blk,
-        )
-        text = re.sub(r"\s+", " ", text).strip()
-        if not text:
-            continue
-        if keep_ts and m:
-            lines.append(f"{m.group(1)} {text}")
-        else:
-            lines.append(text)
-    out = "\n".join(lines) if keep_ts else " ".join(lines)
-    out = re.sub(r"\b(\w+)(\s+\1\b)+", r"\1", out, flags=re.IGNORECASE)
-    out = re.sub(r"\s+([,.;:!?])", r"\1", out)
-    return out
+def yt_info(url: str) -> dict:
+    info = cached_info(url)
+    if info is not None:
+        return info
+
+    key = extract_video_id(url)
+    info = _yt_info_uncached(url)
+    # Re-probe captionless videos sooner; captions are often added after upload
+    has_caps = info.get("subtitles") or info.get("automatic_captions")
+    ttl = META_TTL_SECONDS if has_caps else META_TTL_EMPTY_SECONDS
+    with _META_LOCK:
+        _META_CACHE[key] = (_now() + ttl, info)
+        _META_CACHE.move_to_end(key)
+        while len(_META_CACHE) > META_CACHE_MAX:
+            _META_CACHE.popitem(last=False)
+    return info
 
-# -----------------------------
-# Preview logic
-# -----------------------------
-def build_preview(full_text: str, max_chars: int = 3000, min_sentences: int = 5, char_target: int = 800):
-    sentences = re.split(r'(?<=[.!?])\s+', full_text)
-    preview, count = "", 0
 
-    for s in sentences:
-        if not s.strip():
+def best_caption_url(tracks: List[dict]) -> Optional[str]:
+    # Prefer VTT, else the first format with a URL; one pass over the formats
+    first = None
+    for t in tracks or ():
+        url = t.get("url")
+        if not url:
             continue
-        preview += s.strip() + " "
-        count += 1
-        if count >= min_sentences and len(preview) >= char_target:
-            break
+        if (t.get("ext") or "").lower() == "vtt":
+            return url
+        first = first or url
+    return first
 
-    if len(preview) > max_chars:
-        preview = preview[:max_chars]
 
-    truncated = len(full_text) > len(preview)
-    return preview.strip(), truncated
+async def http_fetch(url: str) -> bytes:
+    """Fetch URL with retry/backoff on 429 and transient 502/503 errors."""
+    delays = [2, 5, 10]
+    for attempt, delay in enumerate(delays, start=1):
+        r = await HTTP.get(url)
+        if r.status_code in (429, 502, 503) and attempt < len(delays):
+            retry_after = r.headers.get("Retry-After", "")
+            await asyncio.sleep(min(int(retry_after), 10) if retry_after.isdigit() else delay + random.uniform(0, 1))
+            continue
+        r.raise_for_status()
+        return r.content
 
 # -----------------------------
 # Caption track selection
 # -----------------------------
-def pick_caption_track(info: dict, langs: List[str]) -> Optional[dict]:
+def caption_candidates(info: dict, langs: List[str]) -> Iterator[Tuple[str, str, List[dict]]]:
+    """Yield (kind, lang, formats) for each matching caption track, most preferred first."""
     subs, autos = info.get("subtitles") or {}, info.get("automatic_captions") or {}
+    seen = set()
 
     for lang in langs:
         if lang == "all":
-            for d in (subs, autos):
-                for tracks in d.values():
-                    if tracks:
-                        return tracks[0]
-        if lang in subs and subs[lang]:
-            return subs[lang][0]
-        if lang in autos and autos[lang]:
-            return autos[lang][0]
-    return None
+            pairs = [("manual", k, v) for k, v in subs.items()] + [("auto", k, v) for k, v in autos.items()]
+        else:
+            pairs = [("manual", lang, subs.get(lang)), ("auto", lang, autos.get(lang))]
+        for kind, key, tracks in pairs:
+            if tracks and (kind, key) not in seen:
+                seen.add((kind, key))
+                yield kind, key, tracks
+
+
+async def fetch_first_caption(candidates: List[Tuple[str, str, List[dict]]]) -> Tuple[Optional[Tuple[str, str]], Optional[bytes]]:
+    """Download candidate tracks concurrently and return the most preferred one with cues.
+
+    Returns ((kind, lang), vtt_bytes); vtt_bytes is None when no candidate has a URL
+    and b"" when every download came back without cues.
+    """
+    urls = [(kind, lang, best_caption_url(tracks)) for kind, lang, tracks in candidates]
+    urls = [u for u in urls if u[2]]
+    if not urls:
+        return None, None
+
+    tasks = [asyncio.create_task(http_fetch(url)) for _, _, url in urls]
+    first_err, fetched = None, False
+    try:
+        # Await in preference order so a faster, less preferred track never wins
+        for (kind, lang, _), task in zip(urls, tasks):
+            try:
+                data = await task
+            except Exception as e:
+                first_err = first_err or e
+                continue
+            fetched = True
+            if b"-->" in data:
+                return (kind, lang), data
+    finally:
+        for task in tasks:
+            task.cancel()
+    if first_err and not fetched:
+        raise first_err
+    return None, b""
+
+async def timedtext_fetch(video_id: str, langs: List[str]) -> Tuple[Optional[Tuple[str, str]], Optional[bytes]]:
+    """Try YouTube's timedtext endpoint directly, without waiting for yt-dlp metadata.
+
+    Probes manual then auto captions for the first few preferred langs; returns
+    ((kind, lang), vtt_bytes) or (None, None). Best effort: one request per probe,
+    no retries, and errors (429s included) count as a miss.
+    """
+    if not _RE_VID_RAW.fullmatch(video_id):
+        return None, None
+    probes = [(kind, lang) for lang in langs if lang != "all" for kind in ("manual", "auto")]
+    probes = probes[:CAPTION_CANDIDATES]
+    if not probes:
+        return None, None
+
+    async def probe(kind: str, lang: str) -> bytes:
+        params = {"v": video_id, "lang": lang, "fmt": "vtt"}
+        if kind == "auto":
+            params["kind"] = "asr"
+        # Unlike http_fetch, never wait out a rate limit: yt-dlp's caption URLs are the fallback
+        r = await HTTP.get("https://www.youtube.com/api/timedtext", params=params)
+        r.raise_for_status()
+        return r.content
+
+    tasks = [asyncio.create_task(probe(kind, lang)) for kind, lang in probes]
+    try:
+        for picked, task in zip(probes, tasks):
+            try:
+                data = await task
+            except Exception:
+                continue
+            if b"-->" in data:
+                return picked, data
+    finally:
+        for task in tasks:
+            task.cancel()
+    return None, None
 
 # -----------------------------
 # Schemas
@@ -294,18 +582,58 @@ class Req(BaseModel):
     url_or_id: str
     langs: str
     keep_timestamps: bool
+    want_pdf: bool = False
 
 # -----------------------------
 # Endpoints
 # -----------------------------
 @app.get("/health")
-def health():
+async def health():
     return {"ok": True, "egress_to_youtube": True, "expires_in_seconds_default": EXPIRES_IN_SECONDS}
 
 
+_INFO_INFLIGHT: Dict[str, "asyncio.Task[dict]"] = {}  # video_id -> running extraction
+
+
+async def fetch_info(url: str) -> dict:
+    """yt_info with at most YT_CONCURRENCY extractions running; 503 if no slot frees up in time.
+
+    Concurrent requests for the same video share one extraction.
+    """
+    info = cached_info(url)
+    if info is not None:
+        return info
+    key = extract_video_id(url)
+    task = _INFO_INFLIGHT.get(key)
+    if task is None:
+        task = _INFO_INFLIGHT[key] = asyncio.create_task(_extract_info(url))
+        task.add_done_callback(functools.partial(_info_done, key))
+    # Shielded so one client disconnecting does not cancel the others' extraction
+    return await asyncio.shield(task)
+
+
+def _info_done(key: str, task: "asyncio.Task[dict]") -> None:
+    if _INFO_INFLIGHT.get(key) is task:
+        del _INFO_INFLIGHT[key]
+    # Mark the exception retrieved: if every waiter was cancelled nobody else will
+    if not task.cancelled():
+        task.exception()
+
+
+async def _extract_info(url: str) -> dict:
+    try:
+        await asyncio.wait_for(_YT_SEM.acquire(), YT_QUEUE_SECONDS)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Too many videos being fetched", headers={"Retry-After": "5"})
+    try:
+        return await run_io(yt_info, url)
+    finally:
+        _YT_SEM.release()
+
+
 @app.get("/probe")
-def probe(url: str):
-    info = yt_info(url)
+async def probe(url: str):
+    info = await fetch_info(url)
     return {
         "info": {
             "title": info.get("title"),
@@ -317,31 +645,78 @@ def probe(url: str):
 
 
 @app.get("/file/{token}")
-def getFile(token: str):
-    _purge_expired()
+async def getFile(token: str):
+    # Expired entries are purged by the janitor; until then just refuse them
     meta = FILES.get(token)
+    if meta and meta["expires_at"] <= _now():
+        meta = None
+    if meta and "source" in meta and "ready" not in meta:
+        # First download of a lazily rendered PDF; later requests wait on `ready`
+        meta["ready"] = asyncio.Event()
+        task = asyncio.create_task(_build_pdf(token))
+        _PDF_TASKS.add(task)
+        task.add_done_callback(_PDF_TASKS.discard)
+    if meta and "ready" in meta:
+        try:
+            await asyncio.wait_for(meta["ready"].wait(), PDF_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=503, detail="File is still being generated", headers={"Retry-After": "5"})
+        meta = FILES.get(token)
     if not meta:
         raise HTTPException(status_code=404, detail="File expired or not found")
     path = Path(meta["path"])
     if not path.exists():
         raise HTTPException(status_code=404, detail="File missing")
-    with open(path, "rb") as f:
-        data = f.read()
-    return Response(
-        content=data,
+    # FileResponse streams the file in chunks and sets Content-Disposition
+    return FileResponse(
+        path,
         media_type=meta["mime"],
-        headers={"Content-Disposition": f"attachment; filename={meta['filename']}"},
+        filename=meta["filename"],
+        headers={"Cache-Control": "private, max-age=3600"},
     )
 
 
-@app.post("/transcript")
-def fetchTranscript(req: Req):
+_PDF_TASKS = set()  # strong refs so lazily started renders are not garbage-collected
+
+
+async def _build_pdf(token: str) -> None:
+    meta = FILES.get(token)
+    if not meta:
+        return
+    ready, path = meta["ready"], Path(meta["path"])
+    try:
+        text = await run_io(Path(meta["source"]).read_text, encoding="utf-8")
+        await run_cpu(render_pdf, text, path)
+        if token in FILES:
+            FILES[token].pop("ready", None)
+        else:
+            path.unlink(missing_ok=True)  # evicted while rendering
+    except Exception:
+        _drop_file(token)
+    finally:
+        # _drop_file releases the .txt itself if the token went away first
+        if "source" in meta:
+            _unref_file(meta.pop("source"))
+        ready.set()
+
+
+@app.post("/transcript", response_model=None)
+async def fetchTranscript(req: Req, background_tasks: BackgroundTasks):
+    wd, direct = None, None
     try:
         langs = ordered_langs(req.langs)
-        info = yt_info(req.url_or_id)
-        track = pick_caption_track(info, langs)
-
-        if not track:
+        vid = extract_video_id(req.url_or_id)
+        info = cached_info(req.url_or_id)
+        if info is None:
+            # Probe timedtext while yt-dlp extracts metadata, so the caption download
+            # overlaps extraction instead of waiting for it. With cached metadata the
+            # SRT cache is checked first and the probe would usually be wasted.
+            direct = asyncio.create_task(timedtext_fetch(vid, langs))
+            # yt-dlp and file I/O block; keep them off the event loop
+            info = await fetch_info(req.url_or_id)
+        candidates = list(islice(caption_candidates(info, langs), CAPTION_CANDIDATES))
+
+        if not candidates:
             return {
                 "ok": False,
                 "error": "No captions found",
@@ -350,43 +725,77 @@ def fetchTranscript(req: Req):
                 "tried_langs": langs,
             }
 
-        vtt_url = best_caption_url([track])
-        if not vtt_url:
-            return {"ok": False, "error": "No caption URL available"}
-
-        vtt_bytes = http_fetch(vtt_url)
-        srt_bytes = vtt_to_srt_bytes(vtt_bytes)
-
-        if not srt_bytes.strip():
-            return {"ok": False, "error": "No usable captions found"}
-
-        full_text = clean_srt_text(srt_bytes, req.keep_timestamps)
-        if not full_text.strip():
-            return {"ok": False, "error": "No usable captions found"}
-
-        preview_text, truncated = build_preview(full_text)
-
-        # Save files
-        base = Path("/tmp")
-        txt_path, srt_path, pdf_path = base / f"{_tok()}.txt", base / f"{_tok()}.srt", base / f"{_tok()}.pdf"
-        txt_path.write_text(full_text, encoding="utf-8")
-        srt_path.write_bytes(srt_bytes)
-
-        # Try PDF
-        pdf_token = None
-        try:
-            from fpdf import FPDF
-            pdf = FPDF()
-            pdf.add_page()
-            pdf.set_font("Arial", size=12)
-            for line in full_text.split("\n"):
-                pdf.multi_cell(0, 10, line)
-            pdf.output(str(pdf_path))
-            pdf_token = _store_file(pdf_path, "application/pdf", "transcript.pdf")
-        except Exception:
-            pdf_token = None
+        # Hold the dir before creating it so the janitor cannot remove it mid-request
+        wd = _video_dir(vid)
+        _hold_dir(wd)
+        await run_io(wd.mkdir, parents=True, exist_ok=True)
+
+        # Reuse the SRT of the preferred track if an earlier request already fetched it
+        picked = candidates[0][:2]
+        srt_path = wd / f"{picked[0]}.{picked[1]}.srt"
+        srt_bytes = await run_io(_read_cached, srt_path)
+        fresh = srt_bytes is None
+
+        if fresh:
+            # The probe is only a head start; if it is still running now that metadata
+            # is in, drop it and fetch yt-dlp's caption URLs instead of waiting on it
+            if direct is not None and direct.done():
+                picked, vtt_bytes = direct.result()
+            else:
+                picked, vtt_bytes = None, None
+                if direct is not None:
+                    direct.cancel()
+            ranked = [c[:2] for c in candidates]
+            # Only trust the direct hit if yt-dlp lists that track among the candidates
+            if picked not in ranked:
+                picked, vtt_bytes = await fetch_first_caption(candidates)
+            elif picked != ranked[0]:
+                # timedtext can come back empty for a track yt-dlp lists (e.g. named manual
+                # tracks), so check the better-ranked ones through their own URLs first
+                try:
+                    better = await fetch_first_caption(candidates[:ranked.index(picked)])
+                except Exception:
+                    better = None, None
+                if better[1]:
+                    picked, vtt_bytes = better
+            if vtt_bytes is None:
+                return {"ok": False, "error": "No caption URL available"}
+            if not picked:
+                return {"ok": False, "error": "No usable captions found"}
+
+            srt_bytes = await run_cpu(vtt_to_srt_bytes, vtt_bytes)
+
+            if not srt_bytes.strip():
+                return {"ok": False, "error": "No usable captions found"}
+
+            srt_path = wd / f"{picked[0]}.{picked[1]}.srt"
+
+        # The cleaned text depends only on the track and the timestamp mode, so it
+        # is shared like the SRT and only rebuilt when the SRT was just fetched
+        mode = "ts" if req.keep_timestamps else "plain"
+        txt_path, pdf_path = wd / f"{picked[0]}.{picked[1]}.{mode}.txt", wd / f"{_tok()}.pdf"
+        preview = _PREVIEWS.get(str(txt_path)) if not fresh else None
+        if preview is None:
+            preview = await run_cpu(write_transcript, srt_bytes, req.keep_timestamps, txt_path)
+            if preview is None:
+                return {"ok": False, "error": "No usable captions found"}
+        if fresh:
+            # Cache the SRT only once it is known to clean to text; a failed request leaves nothing behind
+            await run_io(write_atomic, srt_path, srt_bytes)
+        preview_text, truncated = preview
+
+        # Most clients never download the PDF: render it on first /file hit, or
+        # right after the response when the client asks for it up front
+        if req.want_pdf:
+            pdf_token = _store_file(
+                pdf_path, "application/pdf", "transcript.pdf", ready=asyncio.Event(), source=txt_path
+            )
+            background_tasks.add_task(_build_pdf, pdf_token)
+        else:
+            pdf_token = _store_file(pdf_path, "application/pdf", "transcript.pdf", source=txt_path)
 
         txt_token = _store_file(txt_path, "text/plain", "transcript.txt")
+        _PREVIEWS[str(txt_path)] = preview
         srt_token = _store_file(srt_path, "application/x-subrip", "transcript.srt")
 
         return {
@@ -396,22 +805,32 @@ def fetchTranscript(req: Req):
             "published_at": info.get("upload_date"),
             "duration_s": info.get("duration"),
             "duration_pretty": pretty_duration(info.get("duration", 0)),
-            "video_id": extract_video_id(req.url_or_id),
-            "captions_kind": "manual" if track in sum(info.get("subtitles", {}).values(), []) else "auto",
-            "captions_lang": track.get("lang", "unknown"),
+            "video_id": vid,
+            "captions_kind": picked[0],
+            "captions_lang": picked[1],
             "preview_text": preview_text,
             "truncated": truncated,
             "txt_http_url": _file_url(txt_token),
             "srt_http_url": _file_url(srt_token),
-            "pdf_http_url": _file_url(pdf_token) if pdf_token else None,
+            "pdf_http_url": _file_url(pdf_token),
             "links_expire_in_seconds": EXPIRES_IN_SECONDS,
             "links_expire_human": f"{EXPIRES_IN_SECONDS // 3600}h",
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
+        if isinstance(e, httpx.HTTPStatusError) and e.response.status_code == 429:
+            # Still rate limited after backing off; tell the client to back off too
+            raise HTTPException(status_code=503, detail="YouTube is rate limiting caption downloads", headers={"Retry-After": "10"})
         return {
             "ok": False,
             "error": f"Failed while processing captions: {str(e)}",
             "available_langs": [],
             "tried_langs": ordered_langs(req.langs),
         }
+    finally:
+        if direct is not None:
+            direct.cancel()
+        if wd is not None:
+            _release_dir(wd)
@@ -0,0 +1,43 @@
+from transcript_text import clean_srt_text, vtt_to_srt_bytes
+
+VTT = (
+    b"WEBVTT\n\n"
+    b"00:01.000 --> 00:02.500 align:start\n<c>Hello</c> hello world ,\n\n"
+    b"00:00:03.000 --> 00:00:04.000\nSecond line\nwith two rows.\n"
+)
+
+SRT = (
+    b"1\n00:00:01,000 --> 00:00:02,000\nThe the quick fox .\n\n"
+    b"2\n00:01:05,500 --> 00:01:07,000\nJumps over\nthe dog !\n\n"
+    b"3\n00:01:08,000 --> 00:01:09,000\n\n"
+)
+
+
+def test_vtt_to_srt_bytes():
+    assert vtt_to_srt_bytes(VTT) == (
+        b"1\n00:00:01,000 --> 00:00:02,500\nHello hello world ,\n\n"
+        b"2\n00:00:03,000 --> 00:00:04,000\nSecond line\nwith two rows.\n"
+    )
+
+
+def test_clean_srt_text_keep_timestamps():
+    assert clean_srt_text(SRT, True) == "00:00:01 The quick fox.\n00:01:05 Jumps over the dog!"
+
+
+def test_clean_srt_text_plain():
+    assert clean_srt_text(SRT, False) == "The quick fox. Jumps over the dog!"
+
+
+def test_clean_srt_text_from_vtt():
+    assert clean_srt_text(vtt_to_srt_bytes(VTT), False) == "Hello world, Second line with two rows."
+
+
+def test_clean_srt_text_indented_first_timing_line():
+    srt = b"  00:00:01,000 --> 00:00:02,000\nhello\n"
+    assert clean_srt_text(srt, True) == "00:00:01 hello"
+    assert clean_srt_text(srt, False) == "hello"
+
+
+def test_clean_srt_text_empty():
+    assert clean_srt_text(b"", False) == ""
+    assert clean_srt_text(b"1\n00:00:01,000 --> 00:00:02,000\n\n", True) == ""
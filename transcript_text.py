@@ -0,0 +1,215 @@
+"""Transcript text stages: VTT to SRT, cleaning, previews and PDF rendering.
+
+Kept free of app imports and import-time side effects so CPU-pool workers can
+load it without pulling in yt-dlp, FastAPI or the HTTP client.
+"""
+import io
+import os
+import re
+import secrets
+import unicodedata
+from itertools import chain
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from fpdf import FPDF
+
+# -----------------------------
+# Cleaning
+# -----------------------------
+_RE_TAG = re.compile(r"<[^>]+>")
+_RE_VTT_TS = re.compile(r"(?:(\d+):)?(\d{2}):(\d{2})\.(\d{3})")
+_RE_TS_CAPTURE = re.compile(r"(\d{2}:\d{2}:\d{2}),\d{3}\s*-->")
+_RE_TS_LINE = re.compile(r"\d{2}:\d{2}:\d{2},\d{3}\s*-->\s*\d{2}:\d{2}:\d{2},\d{3}.*$")
+_RE_DEDUP = re.compile(r"\b(\w+)(\s+\1\b)+", re.IGNORECASE)
+_PUNCT_CHARS = ",.;:!?"
+_RE_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+
+
+
+def _srt_timing(head: str) -> str:
+    # SRT wants "HH:MM:SS,mmm --> HH:MM:SS,mmm"; VTT may omit hours and append cue settings
+    stamps = [f"{int(h or 0):02d}:{m}:{sec},{ms}" for h, m, sec, ms in _RE_VTT_TS.findall(head)[:2]]
+    if len(stamps) != 2:
+        return head.replace(".", ",")
+    return f"{stamps[0]} --> {stamps[1]}"
+
+
+def vtt_to_srt_bytes(vtt: bytes) -> bytes:
+    text = vtt.decode("utf-8", errors="ignore")
+    out_lines: List[str] = []
+    head, body, idx = None, [], 1
+    # One pass over the lines; the trailing "" flushes the last cue
+    for ln in chain(text.splitlines(), [""]):
+        s = ln.strip()
+        if s.startswith("WEBVTT"):
+            continue
+        if not s or "-->" in ln:
+            if head is not None:
+                out_lines.append(str(idx))
+                out_lines.append(_srt_timing(head))
+                out_lines.extend(body)
+                out_lines.append("")
+                idx += 1
+                head, body = None, []
+            if s:
+                head = s
+        elif head is not None:
+            body.append(_RE_TAG.sub("", ln) if "<" in ln else ln)
+    return ("\n".join(out_lines)).encode("utf-8")
+
+
+def _srt_block_text(blk: List[str], keep_ts: bool) -> str:
+    # A leading all-digit line is the cue counter, unless it is the only line
+    if len(blk) > 1 and blk[0].strip().isdecimal():
+        blk = blk[1:]
+    ts, parts = None, []
+    for ln in blk:
+        if "-->" in ln:
+            if ts is None:
+                m = _RE_TS_CAPTURE.search(ln)
+                if m:
+                    ts = m.group(1)
+            if _RE_TS_LINE.match(ln):
+                continue
+        parts.append(ln)
+    text = " ".join(" ".join(parts).split())
+    if text and keep_ts and ts:
+        return f"{ts} {text}"
+    return text
+
+
+def _iter_srt_blocks(lines: Iterable[str]) -> Iterator[List[str]]:
+    blk: List[str] = []
+    for ln in lines:
+        if ln.strip():
+            blk.append(ln)
+        elif blk:
+            yield blk
+            blk = []
+    if blk:
+        yield blk
+
+
+def clean_srt_text(srt_bytes: bytes, keep_ts: bool) -> str:
+    # Decode line by line rather than materialising the whole text and a list of its lines
+    stream = io.TextIOWrapper(io.BytesIO(srt_bytes), encoding="utf-8", errors="ignore", newline="\n")
+    lines = []
+    for i, blk in enumerate(_iter_srt_blocks(stream)):
+        if i == 0:
+            # The whole input used to be stripped first, so a timing line opening it may be indented
+            blk[0] = blk[0].lstrip()
+        text = _srt_block_text(blk, keep_ts)
+        if text:
+            lines.append(text)
+    out = "\n".join(lines) if keep_ts else " ".join(lines)
+    out = _RE_DEDUP.sub(r"\1", out)
+    # Cue text is whitespace-normalised above, so the only whitespace left is a
+    # single " " or "\n" separator and plain replaces do what \s+([,.;:!?]) did
+    for p in _PUNCT_CHARS:
+        out = out.replace(" " + p, p).replace("\n" + p, p)
+    return out
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    """Write `path` via a unique .part file so readers streaming the old file never see a partial one."""
+    tmp = path.with_name(f"{path.name}.{secrets.token_hex(4)}.part")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+# -----------------------------
+# Preview logic
+# -----------------------------
+def build_preview(full_text: str, max_chars: int = 3000, min_sentences: int = 5, char_target: int = 800):
+    sentences = _RE_SENTENCE.split(full_text)
+    preview, count = "", 0
+
+    for s in sentences:
+        if not s.strip():
+            continue
+        preview += s.strip() + " "
+        count += 1
+        if count >= min_sentences and len(preview) >= char_target:
+            break
+
+    if len(preview) > max_chars:
+        preview = preview[:max_chars]
+
+    truncated = len(full_text) > len(preview)
+    return preview.strip(), truncated
+
+
+def write_transcript(srt_bytes: bytes, keep_ts: bool, txt_path: Path) -> Optional[Tuple[str, bool]]:
+    """Clean an SRT into `txt_path` and return (preview, truncated); None if there is no text.
+
+    Runs in the CPU pool so the full transcript never travels back to the event loop.
+    """
+    full_text = clean_srt_text(srt_bytes, keep_ts)
+    if not full_text.strip():
+        return None
+    # The .txt is shared by every token for this track; swap it in atomically under readers
+    write_atomic(txt_path, full_text.encode("utf-8"))
+    return build_preview(full_text)
+
+# -----------------------------
+# PDF
+# -----------------------------
+def _wrap_pdf_line(line: str, cw: Dict[str, int], wmax: float, widths: Dict[str, int]) -> Optional[List[str]]:
+    """Greedy word wrap in font units, same breaks as multi_cell; None if a word is wider than a row."""
+    space = cw.get(" ", 0)
+    rows: List[str] = []
+    cur: List[str] = []
+    cur_w = 0
+    for word in line.split(" "):
+        w = widths.get(word)
+        if w is None:
+            # Transcripts repeat a small vocabulary, so word widths are memoised
+            w = widths[word] = sum(cw.get(ch, 0) for ch in word)
+        if w > wmax:
+            return None
+        if not cur:
+            cur, cur_w = [word], w
+        elif cur_w + space + w > wmax:
+            rows.append(" ".join(cur))
+            cur, cur_w = [word], w
+        else:
+            cur.append(word)
+            cur_w += space + w
+    rows.append(" ".join(cur))
+    return rows
+
+
+_RE_NOT_LATIN1 = re.compile(r"[^\x00-\xff]+")
+_PDF_PUNCT = str.maketrans({
+    "\u2018": "'", "\u2019": "'", "\u201c": '"', "\u201d": '"',
+    "\u2013": "-", "\u2014": "-", "\u2026": "...",
+})
+
+
+def _pdf_sanitize(text: str) -> str:
+    """fpdf 1.7's core fonts are latin-1 only: approximate other characters or drop them."""
+    # Almost every transcript is plain ASCII; skip the work entirely then
+    if text.isascii():
+        return text
+    text = text.translate(_PDF_PUNCT)
+    return _RE_NOT_LATIN1.sub(
+        lambda m: unicodedata.normalize("NFKD", m.group()).encode("latin-1", "ignore").decode("latin-1"), text
+    )
+
+
+def render_pdf(text: str, path: Path) -> None:
+    text = _pdf_sanitize(text)
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", size=12)
+    cw = pdf.current_font["cw"]
+    wmax = (pdf.w - pdf.l_margin - pdf.r_margin - 2 * pdf.c_margin) * 1000 / pdf.font_size
+    widths: Dict[str, int] = {}
+    for line in text.split("\n"):
+        rows = _wrap_pdf_line(line, cw, wmax, widths)
+        if rows is None:
+            pdf.multi_cell(0, 10, line)
+            continue
+        for row in rows:
+            pdf.cell(0, 10, row, ln=1)
+    pdf.output(str(path))